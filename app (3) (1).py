@@ -1,6 +1,19 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
+
+from utils import (
+    ARQUIVO_FINANCEIRO,
+    agregar_estado_por_mes,
+    agregar_por_mes,
+    atualizar_financeiro,
+    carregar_e_limpar_financeiro,
+    carregar_linhas_cartorio,
+    formatar_brl,
+    formatar_brl_serie,
+    indexar_cadastro,
+    versao_cadastro,
+    versao_financeiro,
+)
 
 # Configs iniciais da página
 st.set_page_config(
@@ -8,35 +21,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# Função pra carregar os dados de cadastro
-@st.cache_data
-def carregar_cadastro():
-    """Carrega a lista completa de cartórios."""
-    df = pd.read_csv("cadastro_cartorios.csv")
-    return df
-
-@st.cache_data
-def carregar_e_limpar_financeiro():
-    URL_DO_ARQUIVO = "https://drive.google.com/uc?export=download&id=110srBvTbBOWr5ii6atT2zv3PMh5bXML_"
-    df = pd.read_csv(URL_DO_ARQUIVO)
-
-    # Limpeza dos dados
-    coluna_valores = df['Valor arrecadação'].astype(str).str.strip()
-    coluna_valores = coluna_valores.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-    df['Valor arrecadação'] = pd.to_numeric(coluna_valores, errors='coerce')
-    df['Dat. início do período'] = pd.to_datetime(df['Dat. início do período'], format='%d/%m/%Y', errors='coerce')
-    
-    # Remove qualquer linha que tenha falhado na conversão
-    df.dropna(subset=['Valor arrecadação', 'Dat. início do período'], inplace=True)
-    
-    df = df[df['Valor arrecadação'] > 0]
-    
-    return df
-
 # Carregamento inicial dos dados
 try:
-    df_cartorios = carregar_cadastro()
-    df_financeiro_completo = carregar_e_limpar_financeiro()
+    versao_do_cadastro = versao_cadastro()
+    cadastro = indexar_cadastro(versao_do_cadastro)
+    versao_dados = versao_financeiro()
+    carregar_e_limpar_financeiro(versao_dados)
 except Exception as e:
     st.error(f"Erro ao carregar ou processar os arquivos: {e}")
     st.stop()
@@ -44,9 +34,17 @@ except Exception as e:
 # --- BARRA LATERAL ---
 st.sidebar.header("Configurações de Análise")
 
+# Só aqui o app volta ao Drive depois da primeira carga (e só quando o repo não traz o Parquet)
+if not ARQUIVO_FINANCEIRO.exists() and st.sidebar.button("Atualizar dados financeiros"):
+    try:
+        atualizar_financeiro()
+    except Exception as e:
+        st.sidebar.error(f"Não foi possível atualizar os dados: {e}")
+    else:
+        st.rerun()
+
 # 1. Seleção de Estado (Sempre obrigatória para filtrar o financeiro corretamente)
-ufs_disponiveis = sorted(df_cartorios["UF"].unique())
-estado_selecionado = st.sidebar.selectbox("1. Selecione o Estado:", ufs_disponiveis)
+estado_selecionado = st.sidebar.selectbox("1. Selecione o Estado:", cadastro["ufs"])
 
 # 2. Pergunta se você quer ver um específico ou o geral
 modo_analise = st.sidebar.radio(
@@ -55,21 +53,21 @@ modo_analise = st.sidebar.radio(
 )
 
 cartorio_selecionado_nome = None
-cns_para_analise = []
 
 if modo_analise == "Cartório Específico":
     # Lógica antiga de selecionar cidade e nome
-    cidades_no_estado = sorted(df_cartorios[df_cartorios["UF"] == estado_selecionado]["Cidade"].unique())
+    cidades_no_estado = cadastro["cidades_por_uf"][estado_selecionado]
     cidade_selecionada = st.sidebar.selectbox("2. Selecione a Cidade:", cidades_no_estado)
     
-    cartorios_na_cidade = df_cartorios[df_cartorios["Cidade"] == cidade_selecionada]
-    cartorio_selecionado_nome = st.sidebar.selectbox("3. Selecione o Cartório:", cartorios_na_cidade["Denominação"].unique())
+    cartorios_na_cidade = cadastro["cartorios_por_cidade"][(estado_selecionado, cidade_selecionada)]
+    cartorio_selecionado_nome = st.sidebar.selectbox("3. Selecione o Cartório:", cartorios_na_cidade)
     
     if cartorio_selecionado_nome:
-        info_cartorio = df_cartorios[df_cartorios["Denominação"] == cartorio_selecionado_nome].iloc[0]
-        cns_para_analise = [info_cartorio['CNS']]
+        info_cartorio = cadastro["info_por_cartorio"][
+            (estado_selecionado, cidade_selecionada, cartorio_selecionado_nome)
+        ]
 else:
-    cns_para_analise = df_cartorios[df_cartorios["UF"] == estado_selecionado]['CNS'].unique().tolist()
+    cns_para_analise = cadastro["cns_por_uf"][estado_selecionado].tolist()
     st.sidebar.info(f"Analisando dados agregados de {len(cns_para_analise)} cartórios em {estado_selecionado}.")
 
 
@@ -82,22 +80,19 @@ if modo_analise == "Cartório Específico" and not cartorio_selecionado_nome:
 
 # Se for cartório específico, mostra os cards de detalhes
 if modo_analise == "Cartório Específico" and cartorio_selecionado_nome:
-    st.header(f"Detalhes: {info_cartorio['Denominação']}")
+    st.header(f"Detalhes: {cartorio_selecionado_nome}")
     col1, col2, col3 = st.columns(3)
-    col1.metric("Cidade", info_cartorio['Cidade'])
+    col1.metric("Cidade", cidade_selecionada)
     col2.metric("Status", info_cartorio['Status'])
     col3.metric("Tipo", info_cartorio['Tipo'])
     st.markdown("---")
 
-# 1. Filtra o financeiro baseando-se na lista de CNS (seja 1 ou seja 1000)
-df_financeiro_filtrado = df_financeiro_completo[df_financeiro_completo['CNS'].isin(cns_para_analise)]
-
-# 2. Agrega os dados por mês
-if not df_financeiro_filtrado.empty:
-    df_filtrado_agregado = df_financeiro_filtrado.groupby('Dat. início do período')['Valor arrecadação'].sum().reset_index()
-    df_filtrado_agregado.rename(columns={'Dat. início do período': 'Mês'}, inplace=True)
+# Agrega os dados por mês (o estado inteiro já vem pronto do cache)
+if modo_analise == "Visão Geral do Estado":
+    df_filtrado_agregado = agregar_estado_por_mes(versao_dados, versao_do_cadastro, estado_selecionado)
 else:
-    df_filtrado_agregado = pd.DataFrame()
+    # Um cartório só: a fatia sai da tabela ordenada por CNS, sem varrer a coluna inteira
+    df_filtrado_agregado = agregar_por_mes(versao_dados, info_cartorio['CNS'])
 
 titulo_secao = "Análise Financeira Global" if modo_analise == "Visão Geral do Estado" else "Análise Financeira Individual"
 st.header(titulo_secao)
@@ -110,12 +105,12 @@ if not df_filtrado_agregado.empty and len(df_filtrado_agregado) >= 1:
     if len(df_filtrado_agregado) >= 2:
         penultimo_valor = df_filtrado_agregado['Valor arrecadação'].iloc[-2]
         variacao = ultimo_valor - penultimo_valor
-        delta_val = f"R$ {variacao:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+        delta_val = formatar_brl(variacao)
     else:
         delta_val = None
 
     # Formatação BR para exibir
-    valor_formatado = f"R$ {ultimo_valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    valor_formatado = formatar_brl(ultimo_valor)
     
     col_metrica, col_vazia = st.columns([1, 2])
     col_metrica.metric(
@@ -125,27 +120,30 @@ if not df_filtrado_agregado.empty and len(df_filtrado_agregado) >= 1:
         help="Comparação com o mês anterior"
     )
 
-    st.subheader("Evolução da Arrecadação Mensal")
     st.subheader("Evolução da Arrecadação Mensal")
     
-    fig = px.line(
-        df_filtrado_agregado, 
-        x='Mês', 
-        y='Valor arrecadação',
-        title='Histórico de Arrecadação',
-        markers=True # Adiciona bolinhas nos meses
-    )
+    fig = go.Figure(go.Scattergl(
+        x=df_filtrado_agregado['Mês'].to_numpy(),
+        y=df_filtrado_agregado['Valor arrecadação'].to_numpy(),
+        mode='lines+markers', # Adiciona bolinhas nos meses
+    ))
     # Formata o eixo Y para mostrar "R$"
-    fig.update_layout(yaxis_tickprefix = 'R$ ')
+    fig.update_layout(title='Histórico de Arrecadação', yaxis_tickprefix='R$ ', template='plotly_white')
+    fig.update_xaxes(dtick='M1', tickformat='%b/%Y')
     
     st.plotly_chart(fig, use_container_width=True)
     
     # Se quiser ver os dados brutos
     with st.expander("Ver dados detalhados em tabela"):
         if modo_analise == "Visão Geral do Estado":
-             st.dataframe(df_filtrado_agregado) # Mostra o resumão por mês
+             # Mostra o resumão por mês, com os valores em R$
+             st.dataframe({
+                 'Mês': df_filtrado_agregado['Mês'],
+                 'Valor arrecadação': formatar_brl_serie(df_filtrado_agregado['Valor arrecadação']),
+             })
         else:
-             st.dataframe(df_financeiro_filtrado) # Mostra linha a linha do cartório
+             # Mostra linha a linha do cartório, com todas as colunas do financeiro
+             st.dataframe(carregar_linhas_cartorio(versao_dados, info_cartorio['CNS']))
 
 else:
     st.warning("Não foram encontrados dados financeiros suficientes para os filtros selecionados.")
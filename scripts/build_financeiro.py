@@ -0,0 +1,22 @@
+"""Baixa o financeiro do Google Drive, limpa e grava em data/financeiro.parquet.
+
+Rodar sempre que a planilha do Drive for atualizada:
+
+    python scripts/build_financeiro.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import ARQUIVO_FINANCEIRO, gravar_financeiro
+
+
+def main():
+    ARQUIVO_FINANCEIRO.parent.mkdir(parents=True, exist_ok=True)
+    df = gravar_financeiro(ARQUIVO_FINANCEIRO)
+    print(f"{len(df)} linhas gravadas em {ARQUIVO_FINANCEIRO}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Carregamento, limpeza e agregação dos dados do dashboard de cartórios."""
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import requests
+import streamlit as st
+import pandas as pd
+
+ARQUIVO_CADASTRO = Path(__file__).resolve().parent / "cadastro_cartorios.csv"
+# Financeiro já limpo versionado junto com o repo (gerado por scripts/build_financeiro.py)
+ARQUIVO_FINANCEIRO = Path(__file__).resolve().parent / "data" / "financeiro.parquet"
+
+# Os caches persistidos em disco sempre recebem uma versão dos dados (o mtime do arquivo),
+# pra que editar o cadastro ou atualizar o financeiro invalide o que foi salvo.
+def versao_cadastro():
+    """mtime do CSV de cadastro; entra na chave dos caches que dependem dele."""
+    return ARQUIVO_CADASTRO.stat().st_mtime
+
+# Função pra carregar os dados de cadastro
+@st.cache_data(persist="disk", max_entries=1, show_spinner=False)
+def carregar_cadastro(versao):
+    """Carrega a lista completa de cartórios."""
+    df = pd.read_csv(ARQUIVO_CADASTRO)
+    return df
+
+# Os índices são montados uma vez por versão e o mesmo objeto é reaproveitado em todo rerun
+@st.cache_resource(max_entries=1, show_spinner=False)
+def indexar_cadastro(versao):
+    """Listas e dicionários prontos pros filtros da barra lateral."""
+    df = carregar_cadastro(versao)
+    # Denominação e cidade se repetem entre cidades e estados: as chaves levam UF (e cidade) junto
+    chave_cartorio = ["UF", "Cidade", "Denominação"]
+    df_por_cartorio = df.drop_duplicates(chave_cartorio).set_index(chave_cartorio)
+    return {
+        "ufs": sorted(df["UF"].unique()),
+        "cidades_por_uf": df.groupby("UF")["Cidade"].unique().apply(sorted).to_dict(),
+        "cartorios_por_cidade": df.groupby(["UF", "Cidade"])["Denominação"].unique().to_dict(),
+        "cns_por_uf": df.groupby("UF")["CNS"].unique().to_dict(),
+        "uf_por_cns": df.drop_duplicates("CNS").set_index("CNS")["UF"].to_dict(),
+        "info_por_cartorio": df_por_cartorio[["Status", "Tipo", "CNS"]].to_dict("index"),
+    }
+
+ID_ARQUIVO_FINANCEIRO = "110srBvTbBOWr5ii6atT2zv3PMh5bXML_"
+URL_FINANCEIRO = f"https://drive.google.com/uc?export=download&id={ID_ARQUIVO_FINANCEIRO}"
+COLUNAS_FINANCEIRO = ["CNS", "Valor arrecadação", "Dat. início do período"]
+# As colunas usadas são lidas como texto e convertidas na limpeza, sem inferência de tipos
+SCHEMA_FINANCEIRO = {coluna: pa.string() for coluna in COLUNAS_FINANCEIRO}
+
+# Cópias locais do financeiro já limpo, uma por versão (ETag) do arquivo no Drive.
+# _VERSAO_LIMPEZA sobe sempre que a limpeza muda o formato, pra não reaproveitar cópia antiga.
+_VERSAO_LIMPEZA = 5
+_PASTA_CACHE = Path(tempfile.gettempdir())
+_PREFIXO_CACHE = f"financeiro_{ID_ARQUIVO_FINANCEIRO}_"
+_PREFIXO_VERSAO = f"{_PREFIXO_CACHE}v{_VERSAO_LIMPEZA}_"
+# Sessões rodam em threads: só uma baixa o arquivo por vez
+_trava_download = threading.Lock()
+
+def _copias_locais(prefixo=_PREFIXO_VERSAO):
+    """Cópias do financeiro já baixadas, da mais nova pra mais antiga."""
+    copias = _PASTA_CACHE.glob(f"{prefixo}*.parquet")
+    return sorted(copias, key=lambda copia: copia.stat().st_mtime, reverse=True)
+
+def _etiqueta_drive():
+    """ETag (ou Last-Modified) atual do arquivo no Drive, ou None se ele não mandar nenhum."""
+    resposta = requests.head(URL_FINANCEIRO, allow_redirects=True, timeout=30)
+    resposta.raise_for_status()
+    return resposta.headers.get("ETag") or resposta.headers.get("Last-Modified")
+
+def _caminho_copia(etiqueta):
+    sufixo = hashlib.sha1(etiqueta.encode()).hexdigest()[:12] if etiqueta else "sem-etag"
+    return _PASTA_CACHE / f"{_PREFIXO_VERSAO}{sufixo}.parquet"
+
+def atualizar_financeiro():
+    """Baixa o financeiro de novo se a versão do Drive mudou e apaga as cópias antigas.
+
+    Se o Drive não responder, continua usando a cópia mais nova que já existir.
+    """
+    with _trava_download:
+        copias = _copias_locais()
+        try:
+            etiqueta = _etiqueta_drive()
+            caminho = _caminho_copia(etiqueta)
+            if etiqueta is None or caminho not in copias:
+                gravar_financeiro(caminho)
+        except requests.RequestException:
+            if not copias:
+                raise
+            return copias[0]
+        # Apaga as cópias superadas, inclusive as de versões antigas da limpeza
+        for copia in _copias_locais(_PREFIXO_CACHE):
+            if copia != caminho:
+                copia.unlink(missing_ok=True)
+        return caminho
+
+def arquivo_financeiro():
+    """Parquet do financeiro em uso; só acessa o Drive quando não há arquivo do repo nem cópia local."""
+    if ARQUIVO_FINANCEIRO.exists():
+        return ARQUIVO_FINANCEIRO
+    copias = _copias_locais()
+    if copias:
+        return copias[0]
+    return atualizar_financeiro()
+
+def versao_financeiro():
+    """(caminho, mtime) da cópia em uso; entra na chave dos caches que dependem do financeiro."""
+    caminho = arquivo_financeiro()
+    return str(caminho), caminho.stat().st_mtime
+
+def gravar_financeiro(caminho):
+    """Baixa e limpa o financeiro e grava em Parquet, via um temporário único na mesma pasta."""
+    df = baixar_e_limpar_financeiro()
+    with tempfile.NamedTemporaryFile(dir=caminho.parent, suffix=".tmp", delete=False) as temporario:
+        temporario_path = Path(temporario.name)
+        try:
+            df.to_parquet(temporario, engine="pyarrow", compression="zstd")
+        except BaseException:
+            temporario.close()
+            temporario_path.unlink(missing_ok=True)
+            raise
+    temporario_path.replace(caminho)
+    return df
+
+def baixar_e_limpar_financeiro():
+    """Baixa o CSV do Drive e aplica a limpeza (todas as colunas são mantidas)."""
+    # Baixa o CSV comprimido e o leitor do Arrow vai parseando conforme os bytes chegam
+    with requests.get(
+        URL_FINANCEIRO, stream=True, timeout=60, headers={"Accept-Encoding": "gzip"}
+    ) as resposta:
+        resposta.raise_for_status()
+        resposta.raw.decode_content = True
+        tabela = pacsv.read_csv(
+            resposta.raw,
+            # Células vazias viram nulo (como no pd.read_csv), e não string vazia
+            convert_options=pacsv.ConvertOptions(
+                column_types=SCHEMA_FINANCEIRO, strings_can_be_null=True
+            ),
+        )
+    df = tabela.to_pandas(types_mapper=pd.ArrowDtype)
+
+    # Limpeza dos dados (tudo nos kernels do Arrow, sem criar strings Python)
+    coluna_valores = pc.utf8_trim_whitespace(pa.array(df['Valor arrecadação'].array))
+    coluna_valores = pc.replace_substring(pc.replace_substring(coluna_valores, ".", ""), ",", ".")
+    # Valores que não são número viram nulo, igual ao errors='coerce'
+    numero_valido = pc.match_substring_regex(coluna_valores, r"^[+-]?(\d+(\.\d*)?|\.\d+)$")
+    coluna_valores = pc.if_else(numero_valido, coluna_valores, pa.scalar(None, pa.string()))
+    df['Valor arrecadação'] = pd.array(pc.cast(coluna_valores, pa.float64()), dtype="float64[pyarrow]")
+    # As datas são mensais (poucos valores distintos): converte só os únicos e espalha pelos códigos
+    codigos_datas, datas_unicas = pd.factorize(df['Dat. início do período'])
+    datas_convertidas = pd.to_datetime(datas_unicas, format='%d/%m/%Y', errors='coerce').array
+    df['Dat. início do período'] = datas_convertidas.take(codigos_datas, allow_fill=True)
+    
+    # Remove qualquer linha que tenha falhado na conversão ou com CNS vazio (lido como nulo)
+    df.dropna(subset=['CNS', 'Valor arrecadação', 'Dat. início do período'], inplace=True)
+    
+    df = df[df['Valor arrecadação'] > 0]
+
+    # CNS como categoria: filtros e agrupamentos passam a usar os códigos inteiros
+    df['CNS'] = df['CNS'].astype('category')
+
+    # Ordena por CNS e depois por mês: cada cartório vira um bloco contínuo, já em ordem cronológica
+    df = df.sort_values(['CNS', 'Dat. início do período'], kind='stable').reset_index(drop=True)
+
+    return df
+
+# A versão entra na chave do cache: uma cópia nova do Parquet é relida sozinha.
+# cache_resource devolve sempre o mesmo DataFrame, sem copiar a tabela inteira a cada uso
+@st.cache_resource(max_entries=1, show_spinner=False)
+def carregar_e_limpar_financeiro(versao):
+    """Carrega da cópia local em Parquet só as colunas usadas nas análises."""
+    caminho, _ = versao
+    return pd.read_parquet(caminho, columns=COLUNAS_FINANCEIRO)
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def carregar_linhas_cartorio(versao, cns):
+    """Todas as colunas do financeiro de um único cartório, pra tabela detalhada."""
+    caminho, _ = versao
+    return pd.read_parquet(caminho, filters=[('CNS', '==', cns)])
+
+@st.cache_data(persist="disk", max_entries=1, show_spinner=False)
+def carregar_mensal_por_cns(versao):
+    """Soma da arrecadação por (CNS, mês), bem menor que a tabela linha a linha.
+
+    As linhas saem agrupadas por CNS e, dentro de cada um, em ordem cronológica.
+    """
+    df = carregar_e_limpar_financeiro(versao)
+    return df.groupby(
+        ['CNS', 'Dat. início do período'], sort=False, observed=True
+    )['Valor arrecadação'].sum().reset_index()
+
+def fatiar_por_cns(df, cns):
+    """Linhas de um único CNS, achadas por busca binária na tabela ordenada por CNS."""
+    categorias = df['CNS'].cat.categories
+    if cns not in categorias:
+        return df.iloc[0:0]
+    codigo = categorias.get_loc(cns)
+    inicio, fim = np.searchsorted(df['CNS'].cat.codes.to_numpy(), [codigo, codigo + 1])
+    return df.iloc[inicio:fim]
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def agregar_por_mes(versao, cns):
+    """Soma mensal da arrecadação de um cartório, já em ordem cronológica."""
+    df = fatiar_por_cns(carregar_e_limpar_financeiro(versao), cns)
+    # A fatia já vem ordenada por mês, então o sort=False mantém a ordem cronológica
+    agregado = df.groupby('Dat. início do período', sort=False)['Valor arrecadação'].sum()
+    return agregado.rename_axis('Mês').reset_index()
+
+@st.cache_data(persist="disk", max_entries=1, show_spinner=False)
+def carregar_mensal_por_uf(versao, versao_do_cadastro):
+    """Arrecadação mensal de cada estado, indexada por (UF, mês) só nos meses com dados."""
+    df = carregar_mensal_por_cns(versao)
+    uf = df['CNS'].map(indexar_cadastro(versao_do_cadastro)["uf_por_cns"])
+    # sort=True deixa os meses de cada estado em ordem cronológica, que o gráfico e a métrica usam
+    return df.groupby(
+        [uf.rename('UF'), df['Dat. início do período']], sort=True, observed=True
+    )['Valor arrecadação'].sum()
+
+def agregar_estado_por_mes(versao, versao_do_cadastro, uf):
+    """Soma mensal da arrecadação de todos os cartórios do estado."""
+    tabela = carregar_mensal_por_uf(versao, versao_do_cadastro)
+    try:
+        serie = tabela.xs(uf, level='UF')
+    except KeyError:
+        return pd.DataFrame(columns=['Mês', 'Valor arrecadação'])
+    return serie.rename_axis('Mês').reset_index(name='Valor arrecadação')
+
+# Troca os separadores do formato americano (1,234.56) pelo brasileiro (1.234,56)
+_SEPARADORES_BR = str.maketrans({',': '.', '.': ','})
+
+def formatar_brl(valor):
+    """Formata um número como moeda brasileira, ex.: R$ 1.234,56."""
+    return f"R$ {valor:,.2f}".translate(_SEPARADORES_BR)
+
+def formatar_brl_serie(serie):
+    """Versão do formatar_brl para uma coluna inteira, com um único translate por valor."""
+    return "R$ " + serie.map("{:,.2f}".format).str.translate(_SEPARADORES_BR)